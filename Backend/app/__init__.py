@@ -2,19 +2,35 @@
 Application Factory Module
 Initializes Flask app and extensions
 """
-from flask import Flask, jsonify
+import json
+from flask import Flask, Response, jsonify
+from sqlalchemy import text
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_mail import Mail
+from flask_caching import Cache
 from app.config import Config
 
 # Initialize extensions
 db = SQLAlchemy()
-bcrypt = Bcrypt()
 jwt = JWTManager()
 mail = Mail()
+cache = Cache()
+
+# Constant response bodies, encoded once instead of on every hit
+HEALTH_BODY = json.dumps({
+    'status': 'healthy',
+    'message': 'Library Management System API is running'
+}).encode('utf-8')
+NOT_FOUND_BODY = json.dumps({'error': 'Resource not found'}).encode('utf-8')
+INTERNAL_ERROR_BODY = json.dumps({'error': 'Internal server error'}).encode('utf-8')
+BAD_REQUEST_BODY = json.dumps({'error': 'Bad request'}).encode('utf-8')
+
+
+def json_response(body, status):
+    """Wrap pre-encoded JSON bytes in a response"""
+    return Response(body, status=status, mimetype='application/json')
 
 
 def create_app(config_class=Config):
@@ -35,11 +51,27 @@ def create_app(config_class=Config):
     
     # Initialize extensions with app
     db.init_app(app)
-    bcrypt.init_app(app)
     jwt.init_app(app)
     # Configure CORS with explicit settings for all origins and methods
     CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]}})
     mail.init_app(app)
+    cache.init_app(app)
+    
+    # Background pool for outgoing mail
+    from app.utils import init_mail_queue
+    init_mail_queue(app)
+    
+    # Per-request SQL statement counting (development and testing)
+    from app.diagnostics import init_query_counter
+    init_query_counter(app, db)
+    
+    # orjson response encoding when installed
+    from app.json_provider import init_json
+    init_json(app)
+    
+    # Optional process pool for password hashing
+    from app.security import init_security
+    init_security(app)
     
     # Register blueprints
     from app.routes.auth import auth_bp
@@ -57,16 +89,16 @@ def create_app(config_class=Config):
     # Global error handlers
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({'error': 'Resource not found'}), 404
+        return json_response(NOT_FOUND_BODY, 404)
     
     @app.errorhandler(500)
     def internal_error(error):
         db.session.rollback()
-        return jsonify({'error': 'Internal server error'}), 500
+        return json_response(INTERNAL_ERROR_BODY, 500)
     
     @app.errorhandler(400)
     def bad_request(error):
-        return jsonify({'error': 'Bad request'}), 400
+        return json_response(BAD_REQUEST_BODY, 400)
     
     # JWT error handlers
     @jwt.expired_token_loader
@@ -84,9 +116,14 @@ def create_app(config_class=Config):
     # Health check endpoint
     @app.route('/api/health')
     def health():
-        return jsonify({
-            'status': 'healthy',
-            'message': 'Library Management System API is running'
-        }), 200
+        return json_response(HEALTH_BODY, 200)
+    
+    # Open the first pooled connection now rather than on the first request
+    if not app.config.get('TESTING'):
+        with app.app_context():
+            try:
+                db.session.execute(text('SELECT 1'))
+            except Exception as e:
+                app.logger.warning(f'Database warm-up failed: {str(e)}')
     
     return app
\ No newline at end of file
@@ -10,6 +10,28 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def engine_options(database_uri):
+    """
+    Build SQLAlchemy engine options for a database URI
+    
+    Args:
+        database_uri: Database connection URI
+        
+    Returns:
+        dict: Connection pool settings (empty for SQLite, which ignores them)
+    """
+    if database_uri.startswith('sqlite'):
+        return {}
+    
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10))
+    }
+
+
 class Config:
     """Base configuration class"""
     
@@ -19,13 +41,21 @@ class Config:
     
     # Database Configuration
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///library.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ECHO = DEBUG
+    SQLALCHEMY_ECHO = os.getenv('SQL_ECHO', 'False').lower() == 'true'
     
     # JWT Configuration
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 86400)))
     
+    # Password Hashing Configuration ('bcrypt', 'argon2' or 'plaintext' for tests)
+    PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'bcrypt')
+    # bcrypt cost factor used by the bcrypt password hasher
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 10))
+    # Processes used for bcrypt work (0 hashes inline on the request thread)
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 0))
+    
     # Email Configuration
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
@@ -34,6 +64,9 @@ class Config:
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'library@example.com')
     
+    # Threads sending mail in the background (0 sends inline on the caller)
+    MAIL_SEND_WORKERS = int(os.getenv('MAIL_SEND_WORKERS', 4))
+    
     # Business Logic Configuration
     FINE_PER_DAY = float(os.getenv('FINE_PER_DAY', 0.50))
     GRACE_PERIOD_DAYS = int(os.getenv('GRACE_PERIOD_DAYS', 3))
@@ -41,25 +74,54 @@ class Config:
     
     # Pagination
     ITEMS_PER_PAGE = 20
+    
+    # Encode responses with orjson when it is installed
+    USE_ORJSON = os.getenv('USE_ORJSON', 'True').lower() == 'true'
+    
+    # Raise instead of lazy loading relationships in safe_query() (catches N+1)
+    RAISE_ON_LAZY_LOAD = False
+    
+    # Log requests issuing more SQL statements than this (0 disables)
+    QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', 0))
+    
+    # Caching (Flask-Caching; set CACHE_TYPE=RedisCache and CACHE_REDIS_URL
+    # so all workers share one cache)
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+    STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', 60))
+    DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 30))
+    
+    # Category list cache (seconds; 0 disables)
+    CATEGORY_CACHE_TTL = int(os.getenv('CATEGORY_CACHE_TTL', 60))
 
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
+    QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', 15))
 
 
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test_library.db'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=5)
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASHER = 'plaintext'
+    RAISE_ON_LAZY_LOAD = True
+    QUERY_COUNT_WARNING = 15
+    MAIL_SEND_WORKERS = 0
+    CACHE_TYPE = 'NullCache'
+    CATEGORY_CACHE_TTL = 0
 
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
 
 
 # Config dictionary
@@ -0,0 +1,45 @@
+"""
+Diagnostics Module
+Development-time warnings for requests that issue too many SQL statements
+"""
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+def init_query_counter(app, db):
+    """
+    Count SQL statements per request and log requests over the threshold
+    
+    Enabled when QUERY_COUNT_WARNING is set; a request crossing it is
+    usually a relationship being lazy loaded once per row (N+1).
+    
+    Args:
+        app: Flask application instance
+        db: SQLAlchemy extension bound to app
+    """
+    threshold = app.config.get('QUERY_COUNT_WARNING', 0)
+    if not threshold:
+        return
+    
+    with app.app_context():
+        engine = db.engine
+    
+    @app.before_request
+    def reset_query_count():
+        # g belongs to the app context, which may outlive a single request
+        g.query_count = 0
+    
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+    
+    @app.after_request
+    def warn_on_query_count(response):
+        count = g.get('query_count', 0)
+        if count > threshold:
+            app.logger.warning(
+                f'{request.method} {request.path} issued {count} SQL statements '
+                f'(QUERY_COUNT_WARNING={threshold}); check for N+1 lazy loads'
+            )
+        return response
@@ -0,0 +1,39 @@
+"""
+JSON Provider Module
+Faster response encoding with orjson when it is installed
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency; Flask's stdlib provider is used instead
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, keeping Flask's key sorting"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        
+        # Types orjson can't encode natively (Decimal sums, UUIDs...) go
+        # through Flask's usual conversions
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_json(app):
+    """
+    Install the orjson provider if available and enabled
+    
+    Args:
+        app: Flask application instance
+    """
+    if orjson is not None and app.config.get('USE_ORJSON', True):
+        app.json = OrjsonProvider(app)
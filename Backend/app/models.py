@@ -3,7 +3,10 @@ Database Models
 Defines all database tables and relationships
 """
 from datetime import datetime
-from app import db, bcrypt
+from sqlalchemy import DDL, event, func, literal_column
+from sqlalchemy.orm import deferred, validates
+from app import db
+from app.security import hash_password, verify_password
 
 
 class User(db.Model):
@@ -17,7 +20,10 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), default='member', nullable=False)  # 'admin' or 'member'
     is_active = db.Column(db.Boolean, default=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # The Python default still fills databases created without the server default
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False)
+    # Sum of fines on unreturned loans, kept by refresh_outstanding_fines()
+    outstanding_fines = db.Column(db.Float, default=0.0, server_default='0', nullable=False)
     
     # Relationships
     loans = db.relationship('Loan', backref='user', lazy='dynamic', cascade='all, delete-orphan')
@@ -27,11 +33,11 @@ class User(db.Model):
     
     def set_password(self, password):
         """Hash and set user password"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def to_dict(self):
         """Convert user to dictionary"""
@@ -52,13 +58,20 @@ class Category(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    name_ci = db.Column(db.String(50), unique=True, nullable=False, index=True)  # lowercase name for indexed case-insensitive lookups
     
     # Relationships
-    books = db.relationship('Book', backref='category', lazy='dynamic')
+    books = db.relationship('Book', backref='category')
     
     def __repr__(self):
         return f'<Category {self.name}>'
     
+    @validates('name')
+    def validate_name(self, key, name):
+        """Keep the lowercase lookup column in sync with name"""
+        self.name_ci = name.lower() if name else name
+        return name
+    
     def to_dict(self):
         """Convert category to dictionary"""
         return {
@@ -70,6 +83,9 @@ class Category(db.Model):
 class Book(db.Model):
     """Book model for library inventory"""
     __tablename__ = 'books'
+    __table_args__ = (
+        db.Index('ix_books_active_category', 'is_active', 'category_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     isbn = db.Column(db.String(13), unique=True, nullable=False, index=True)
@@ -79,9 +95,9 @@ class Book(db.Model):
     total_copies = db.Column(db.Integer, default=1, nullable=False)
     available_copies = db.Column(db.Integer, default=1, nullable=False)
     publication_year = db.Column(db.Integer)
-    description = db.Column(db.Text)
+    description = deferred(db.Column(db.Text))  # large TEXT, loaded only when accessed
     is_active = db.Column(db.Boolean, default=True, nullable=False, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False)
     
     # Relationships
     loans = db.relationship('Loan', backref='book', lazy='dynamic', cascade='all, delete-orphan')
@@ -89,9 +105,20 @@ class Book(db.Model):
     def __repr__(self):
         return f'<Book {self.title}>'
     
-    def to_dict(self):
-        """Convert book to dictionary"""
-        return {
+    @classmethod
+    def search_vector(cls):
+        """Full-text search document over title and author (PostgreSQL only)"""
+        document = cls.title.op('||')(literal_column("' '")).op('||')(cls.author)
+        return func.to_tsvector(literal_column("'simple'"), document)
+    
+    def to_dict(self, include_description=True):
+        """
+        Convert book to dictionary
+        
+        Args:
+            include_description: Include the deferred description column
+        """
+        data = {
             'id': self.id,
             'isbn': self.isbn,
             'title': self.title,
@@ -100,20 +127,55 @@ class Book(db.Model):
             'total_copies': self.total_copies,
             'available_copies': self.available_copies,
             'publication_year': self.publication_year,
-            'description': self.description,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat()
         }
+        if include_description:
+            data['description'] = self.description
+        return data
+
+
+# Trigram indexes let PostgreSQL serve the catalog's ILIKE '%term%' search
+# from an index; other dialects keep the plain B-tree indexes above
+event.listen(
+    Book.__table__,
+    'after_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+for _column in ('title', 'author', 'isbn'):
+    event.listen(
+        Book.__table__,
+        'after_create',
+        DDL(
+            f'CREATE INDEX IF NOT EXISTS ix_books_{_column}_trgm '
+            f'ON books USING gin ({_column} gin_trgm_ops)'
+        ).execute_if(dialect='postgresql')
+    )
+
+# Expression index backing Book.search_vector(); must match it exactly
+event.listen(
+    Book.__table__,
+    'after_create',
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_books_search_tsv "
+        "ON books USING gin (to_tsvector('simple', title || ' ' || author))"
+    ).execute_if(dialect='postgresql')
+)
 
 
 class Loan(db.Model):
     """Loan model for book borrowing records"""
     __tablename__ = 'loans'
+    __table_args__ = (
+        db.Index('ix_loans_user_status', 'user_id', 'status'),
+        db.Index('ix_loans_status_due', 'status', 'due_date'),
+        db.Index('ix_loans_user_fine_return', 'user_id', 'fine_amount', 'return_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
-    borrow_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    borrow_date = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False, index=True)
     due_date = db.Column(db.DateTime, nullable=False, index=True)
     return_date = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='active', nullable=False, index=True)  # 'active', 'returned', 'overdue'
@@ -127,7 +189,7 @@ class Loan(db.Model):
         return {
             'id': self.id,
             'user': self.user.to_dict(),
-            'book': self.book.to_dict(),
+            'book': self.book.to_dict(include_description=False),
             'borrow_date': self.borrow_date.isoformat(),
             'due_date': self.due_date.isoformat(),
             'return_date': self.return_date.isoformat() if self.return_date else None,
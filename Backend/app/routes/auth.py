@@ -4,9 +4,10 @@ Handles user registration, login, and authentication
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from sqlalchemy import exists
 from app import db
 from app.models import User
-from app.utils import validate_email
+from app.utils import clear_stats_cache, validate_email
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -41,7 +42,7 @@ def register():
             return jsonify({'error': 'Invalid email format'}), 400
         
         # Check if email already exists
-        if User.query.filter_by(email=data['email']).first():
+        if db.session.query(exists().where(User.email == data['email'])).scalar():
             return jsonify({'error': 'Email already registered'}), 400
         
         # Validate password length
@@ -58,6 +59,7 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'User registered successfully',
@@ -104,8 +106,12 @@ def login():
         if not user.is_active:
             return jsonify({'error': 'Account is inactive. Please contact admin.'}), 403
         
-        # Create access token with string identity
-        access_token = create_access_token(identity=str(user.id))
+        # Create access token with string identity; role is embedded so
+        # admin checks can skip the users table
+        access_token = create_access_token(
+            identity=str(user.id),
+            additional_claims={'role': user.role}
+        )
         
         return jsonify({
             'message': 'Login successful',
@@ -133,7 +139,7 @@ def get_current_user():
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
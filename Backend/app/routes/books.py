@@ -2,22 +2,80 @@
 Books Routes
 Handles book management and catalog operations
 """
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import or_
-from app import db
-from app.models import Book, Category, User
-from app.utils import validate_isbn
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required
+from sqlalchemy import exists, func, literal_column, or_
+from sqlalchemy.orm import joinedload, undefer
+from app import cache, db
+from app.models import Book, Category
+from app.utils import MAX_PAGE_SIZE, clear_stats_cache, is_admin, safe_query, validate_isbn
 
 books_bp = Blueprint('books', __name__)
 
+# Columns read by the catalog listing; rows come back as plain tuples so no
+# Book/Category instances are built per result
+BOOK_LIST_COLUMNS = (
+    Book.id,
+    Book.isbn,
+    Book.title,
+    Book.author,
+    Category.id.label('category_id'),
+    Category.name.label('category_name'),
+    Book.total_copies,
+    Book.available_copies,
+    Book.publication_year,
+    Book.description,
+    Book.is_active,
+    Book.created_at
+)
 
-def is_admin():
-    """Check if current user is admin"""
-    user_id_str = get_jwt_identity()
-    user_id = int(user_id_str)
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
+
+def book_row_to_dict(row):
+    """Convert a BOOK_LIST_COLUMNS row to the same shape as Book.to_dict()"""
+    return {
+        'id': row.id,
+        'isbn': row.isbn,
+        'title': row.title,
+        'author': row.author,
+        'category': {
+            'id': row.category_id,
+            'name': row.category_name
+        } if row.category_id is not None else None,
+        'total_copies': row.total_copies,
+        'available_copies': row.available_copies,
+        'publication_year': row.publication_year,
+        'description': row.description,
+        'is_active': row.is_active,
+        'created_at': row.created_at.isoformat()
+    }
+
+
+def is_keyset_request():
+    """Check if the client asked for a keyset-paginated page"""
+    return 'after_id' in request.args or 'limit' in request.args
+
+
+def keyset_page(query, id_column):
+    """
+    Apply keyset (seek) pagination to a query
+    
+    Args:
+        query: Query to paginate
+        id_column: Primary key column used as the seek key
+        
+    Returns:
+        tuple: (rows, next_after_id) where next_after_id is None on the last page
+    """
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', type=int) or current_app.config['ITEMS_PER_PAGE']
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    if after_id:
+        query = query.filter(id_column > after_id)
+    
+    rows = query.order_by(id_column.asc()).limit(limit).all()
+    next_after_id = rows[-1].id if len(rows) == limit else None
+    return rows, next_after_id
 
 
 @books_bp.route('/', methods=['GET'])
@@ -26,12 +84,16 @@ def get_books():
     Get all books with optional filters
     
     Query Parameters:
-        search: Search term for title, author, or ISBN
+        search: Search term for title, author, or ISBN (ranked by relevance
+                on PostgreSQL unless paginating)
         category: Category ID filter
         available: Filter available books only (true/false)
+        after_id: Return books with an ID greater than this (keyset pagination)
+        limit: Page size (default: ITEMS_PER_PAGE, max: 100)
     
     Returns:
-        200: List of books
+        200: List of books, or a page {items, next_after_id} when
+             after_id/limit is given
     """
     try:
         # Get query parameters
@@ -39,30 +101,60 @@ def get_books():
         category_id = request.args.get('category', type=int)
         available_only = request.args.get('available', 'false').lower() == 'true'
         
-        # Build query
-        query = Book.query.filter_by(is_active=True)
+        # Build query (category is joined in, so no per-book lookups)
+        query = db.session.query(*BOOK_LIST_COLUMNS)\
+            .outerjoin(Category, Book.category_id == Category.id)\
+            .filter(Book.is_active == True)
         
-        # Apply search filter
+        # Apply search filter; ILIKE keeps substring matches (served by the
+        # trigram indexes on PostgreSQL), and PostgreSQL also matches and
+        # ranks whole words through the full-text index
+        rank = None
         if search:
             search_filter = or_(
                 Book.title.ilike(f'%{search}%'),
                 Book.author.ilike(f'%{search}%'),
                 Book.isbn.ilike(f'%{search}%')
             )
+            if db.session.get_bind().dialect.name == 'postgresql':
+                ts_query = func.plainto_tsquery(literal_column("'simple'"), search)
+                search_filter = or_(
+                    Book.search_vector().op('@@', is_comparison=True)(ts_query),
+                    search_filter
+                )
+                rank = func.ts_rank(Book.search_vector(), ts_query)
             query = query.filter(search_filter)
         
         # Apply category filter
         if category_id:
-            query = query.filter_by(category_id=category_id)
+            query = query.filter(Book.category_id == category_id)
         
         # Apply availability filter
         if available_only:
             query = query.filter(Book.available_copies > 0)
         
-        # Execute query
-        books = query.all()
+        # Keyset pagination (opt-in so existing clients keep receiving a list)
+        if is_keyset_request():
+            books, next_after_id = keyset_page(query, Book.id)
+            return jsonify({
+                'items': [book_row_to_dict(book) for book in books],
+                'next_after_id': next_after_id
+            }), 200
+        
+        # Best search matches first
+        if rank is not None:
+            query = query.order_by(rank.desc(), Book.id.asc())
         
-        return jsonify([book.to_dict() for book in books]), 200
+        # Stream rows from the cursor and serialize them one at a time
+        def generate():
+            yield '['
+            for index, book in enumerate(query.yield_per(200)):
+                if index:
+                    yield ','
+                yield current_app.json.dumps(book_row_to_dict(book))
+            yield ']'
+        
+        return Response(stream_with_context(generate()), status=200, mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -81,7 +173,9 @@ def get_book(book_id):
         404: Book not found
     """
     try:
-        book = Book.query.get_or_404(book_id)
+        book = safe_query(Book)\
+            .options(joinedload(Book.category), undefer(Book.description))\
+            .get_or_404(book_id)
         
         if not book.is_active:
             return jsonify({'error': 'Book not found'}), 404
@@ -130,7 +224,7 @@ def create_book():
             return jsonify({'error': 'Invalid ISBN format (must be 13 digits)'}), 400
         
         # Check if ISBN already exists
-        if Book.query.filter_by(isbn=data['isbn']).first():
+        if db.session.query(exists().where(Book.isbn == data['isbn'])).scalar():
             return jsonify({'error': 'ISBN already exists'}), 400
         
         # Validate total_copies
@@ -152,6 +246,7 @@ def create_book():
         
         db.session.add(book)
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'Book created successfully',
@@ -163,6 +258,91 @@ def create_book():
         return jsonify({'error': str(e)}), 500
 
 
+@books_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_books():
+    """
+    Create many books in one transaction (Admin only)
+    
+    Request Body:
+        [
+            {
+                "isbn": "string",
+                "title": "string",
+                "author": "string",
+                "category_id": integer (optional),
+                "total_copies": integer (optional, default: 1),
+                "publication_year": integer (optional),
+                "description": "string" (optional)
+            },
+            ...
+        ]
+    
+    Returns:
+        201: Books created (ISBNs that already exist are skipped)
+        400: Invalid input
+        403: Admin access required
+    """
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        data = request.get_json()
+        
+        if not isinstance(data, list) or not data:
+            return jsonify({'error': 'Request body must be a non-empty list of books'}), 400
+        
+        # Validate every row before touching the database
+        required_fields = ['isbn', 'title', 'author']
+        for index, item in enumerate(data):
+            if not isinstance(item, dict) or not all(field in item for field in required_fields):
+                return jsonify({'error': f'Missing required fields in book at index {index}'}), 400
+            if not validate_isbn(item['isbn']):
+                return jsonify({'error': f'Invalid ISBN format at index {index} (must be 13 digits)'}), 400
+            if item.get('total_copies', 1) < 1:
+                return jsonify({'error': f'Total copies must be at least 1 at index {index}'}), 400
+        
+        # Fetch all ISBNs that already exist in a single IN query
+        existing_isbns = {
+            isbn for (isbn,) in db.session.query(Book.isbn)
+            .filter(Book.isbn.in_([item['isbn'] for item in data]))
+        }
+        
+        rows = []
+        skipped = []
+        for item in data:
+            if item['isbn'] in existing_isbns:
+                skipped.append(item['isbn'])
+                continue
+            
+            existing_isbns.add(item['isbn'])
+            total_copies = item.get('total_copies', 1)
+            rows.append({
+                'isbn': item['isbn'],
+                'title': item['title'],
+                'author': item['author'],
+                'category_id': item.get('category_id'),
+                'total_copies': total_copies,
+                'available_copies': total_copies,
+                'publication_year': item.get('publication_year'),
+                'description': item.get('description')
+            })
+        
+        db.session.bulk_insert_mappings(Book, rows)
+        db.session.commit()
+        clear_stats_cache()
+        
+        return jsonify({
+            'message': f'{len(rows)} books created successfully',
+            'created': len(rows),
+            'skipped_isbns': skipped
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @books_bp.route('/<int:book_id>', methods=['PUT'])
 @jwt_required()
 def update_book(book_id):
@@ -218,6 +398,7 @@ def update_book(book_id):
             book.available_copies = max(0, book.available_copies + diff)
         
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'Book updated successfully',
@@ -257,6 +438,7 @@ def delete_book(book_id):
         # Soft delete
         book.is_active = False
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({'message': 'Book deleted successfully'}), 200
         
@@ -267,17 +449,48 @@ def delete_book(book_id):
 
 # ============= CATEGORY ROUTES =============
 
+# Cache key for the serialized category list
+CATEGORY_CACHE_KEY = 'categories'
+
+
+def clear_category_cache():
+    """Drop the cached category list after a category is changed"""
+    cache.delete(CATEGORY_CACHE_KEY)
+
+
 @books_bp.route('/categories', methods=['GET'])
 def get_categories():
     """
     Get all categories
     
+    Query Parameters:
+        after_id: Return categories with an ID greater than this (keyset pagination)
+        limit: Page size (default: ITEMS_PER_PAGE, max: 100)
+    
     Returns:
-        200: List of categories
+        200: List of categories, or a page {items, next_after_id} when
+             after_id/limit is given
     """
     try:
-        categories = Category.query.all()
-        return jsonify([cat.to_dict() for cat in categories]), 200
+        if is_keyset_request():
+            categories, next_after_id = keyset_page(safe_query(Category), Category.id)
+            return jsonify({
+                'items': [cat.to_dict() for cat in categories],
+                'next_after_id': next_after_id
+            }), 200
+        
+        # Serve the pre-serialized list while it is fresh
+        body = cache.get(CATEGORY_CACHE_KEY)
+        if body is not None:
+            return Response(body, status=200, mimetype='application/json')
+        
+        categories = safe_query(Category).all()
+        body = current_app.json.dumps([cat.to_dict() for cat in categories])
+        ttl = current_app.config['CATEGORY_CACHE_TTL']
+        if ttl > 0:
+            cache.set(CATEGORY_CACHE_KEY, body, timeout=ttl)
+        
+        return Response(body, status=200, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -311,17 +524,19 @@ def create_category():
         category_name = data['name'].strip()
         
         # Check if category already exists (case-insensitive)
-        existing_category = Category.query.filter(
-            Category.name.ilike(category_name)
-        ).first()
+        category_exists = db.session.query(
+            exists().where(Category.name_ci == category_name.lower())
+        ).scalar()
         
-        if existing_category:
+        if category_exists:
             return jsonify({'error': 'Category already exists'}), 400
         
         # Create category
         category = Category(name=category_name)
         db.session.add(category)
         db.session.commit()
+        clear_stats_cache()
+        clear_category_cache()
         
         return jsonify({
             'message': 'Category created successfully',
@@ -367,17 +582,21 @@ def update_category(category_id):
         new_name = data['name'].strip()
         
         # Check if new name already exists (excluding current category)
-        existing_category = Category.query.filter(
-            Category.name.ilike(new_name),
-            Category.id != category_id
-        ).first()
+        name_taken = db.session.query(
+            exists().where(
+                Category.name_ci == new_name.lower(),
+                Category.id != category_id
+            )
+        ).scalar()
         
-        if existing_category:
+        if name_taken:
             return jsonify({'error': 'Category name already exists'}), 400
         
         # Update category
         category.name = new_name
         db.session.commit()
+        clear_stats_cache()
+        clear_category_cache()
         
         return jsonify({
             'message': 'Category updated successfully',
@@ -410,14 +629,17 @@ def delete_category(category_id):
         
         category = Category.query.get_or_404(category_id)
         
-        # Check if category has books
-        if category.books.count() > 0:
+        # Check if category has books (stops at the first match)
+        has_books = db.session.query(Book.id).filter_by(category_id=category_id).first() is not None
+        if has_books:
             return jsonify({
                 'error': 'Cannot delete category with books. Reassign or delete books first.'
             }), 400
         
         db.session.delete(category)
         db.session.commit()
+        clear_stats_cache()
+        clear_category_cache()
         
         return jsonify({'message': 'Category deleted successfully'}), 200
         
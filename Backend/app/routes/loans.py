@@ -2,24 +2,28 @@
 Loans Routes
 Handles book borrowing, returning, and loan management
 """
-from flask import Blueprint, request, jsonify
+import csv
+import io
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from app import db
 from app.models import Loan, Book, User
 from app.config import Config
+from app.utils import (
+    clear_stats_cache, is_admin, is_page_request, loan_query_with_loads,
+    loan_row_to_dict, loan_rows_query, paginated, refresh_outstanding_fines
+)
 
 loans_bp = Blueprint('loans', __name__)
 
 LOAN_DURATIONS = {7: 7, 14: 14, 21: 21}
 
-
-def is_admin():
-    """Check if current user is admin"""
-    user_id_str = get_jwt_identity()
-    user_id = int(user_id_str)
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
+# Columns written by the loans export, in order
+EXPORT_FIELDS = (
+    'id', 'user_id', 'user_name', 'user_email', 'book_id', 'book_isbn', 'book_title',
+    'borrow_date', 'due_date', 'return_date', 'status', 'fine_amount'
+)
 
 
 @loans_bp.route('/borrow', methods=['POST'])
@@ -42,7 +46,6 @@ def borrow_book():
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)
-        user = User.query.get(user_id)
         data = request.get_json()
         
         # Validate required fields
@@ -56,30 +59,37 @@ def borrow_book():
         if duration not in LOAN_DURATIONS:
             return jsonify({'error': 'Invalid loan duration. Choose 7, 14, or 21 days'}), 400
         
-        # Check if user has outstanding fines
-        total_fines = db.session.query(db.func.sum(Loan.fine_amount))\
-            .filter(Loan.user_id == user_id, Loan.fine_amount > 0, Loan.return_date.is_(None))\
-            .scalar() or 0
+        # Check if user has outstanding fines (kept on the user row)
+        total_fines = db.session.query(User.outstanding_fines)\
+            .filter(User.id == user_id).scalar() or 0
         
         if total_fines > 0:
             return jsonify({
                 'error': f'Please pay outstanding fines (${total_fines:.2f}) before borrowing'
             }), 400
         
-        # Check active loans count
-        active_loans = Loan.query.filter_by(user_id=user_id, status='active').count()
+        # Check active loans count (the LIMIT stops the scan once the cap is reached)
+        active_loans = db.session.query(Loan.id)\
+            .filter_by(user_id=user_id, status='active')\
+            .limit(Config.MAX_BOOKS_PER_USER).count()
         if active_loans >= Config.MAX_BOOKS_PER_USER:
             return jsonify({
                 'error': f'Maximum {Config.MAX_BOOKS_PER_USER} books allowed per member'
             }), 400
         
-        # Check book availability
-        book = Book.query.get_or_404(book_id)
-        
-        if not book.is_active:
-            return jsonify({'error': 'Book not available'}), 404
-        
-        if book.available_copies < 1:
+        # Take a copy in one conditional UPDATE so concurrent borrows can't over-lend
+        updated = db.session.query(Book).filter(
+            Book.id == book_id,
+            Book.is_active == True,
+            Book.available_copies >= 1
+        ).update({Book.available_copies: Book.available_copies - 1}, synchronize_session=False)
+        
+        if updated == 0:
+            is_active = db.session.query(Book.is_active).filter(Book.id == book_id).scalar()
+            if is_active is None:
+                return jsonify({'error': 'Book not found'}), 404
+            if not is_active:
+                return jsonify({'error': 'Book not available'}), 404
             return jsonify({'error': 'No copies available for borrowing'}), 400
         
         # Create loan
@@ -91,11 +101,9 @@ def borrow_book():
             status='active'
         )
         
-        # Update book availability
-        book.available_copies -= 1
-        
         db.session.add(loan)
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'Book borrowed successfully',
@@ -134,12 +142,14 @@ def return_book(loan_id):
         if loan.status == 'returned':
             return jsonify({'error': 'Book already returned'}), 400
         
-        # Calculate fine if overdue
+        # A fine on an unreturned loan counts as outstanding until it's returned
+        had_fine = loan.fine_amount > 0
+        
+        # Calculate fine if overdue, in whole elapsed days like calculate_fines
         return_date = datetime.utcnow()
-        grace_end = loan.due_date + timedelta(days=Config.GRACE_PERIOD_DAYS)
+        days_overdue = (return_date - loan.due_date).days - Config.GRACE_PERIOD_DAYS
         
-        if return_date > grace_end:
-            days_overdue = (return_date - loan.due_date).days - Config.GRACE_PERIOD_DAYS
+        if days_overdue > 0:
             loan.fine_amount = days_overdue * Config.FINE_PER_DAY
         
         # Update loan
@@ -147,10 +157,14 @@ def return_book(loan_id):
         loan.status = 'returned'
         
         # Update book availability
-        book = Book.query.get(loan.book_id)
-        book.available_copies += 1
+        db.session.query(Book).filter(Book.id == loan.book_id)\
+            .update({Book.available_copies: Book.available_copies + 1}, synchronize_session=False)
+        
+        if had_fine:
+            refresh_outstanding_fines([loan.user_id])
         
         db.session.commit()
+        clear_stats_cache()
         
         message = 'Book returned successfully'
         if loan.fine_amount > 0:
@@ -180,7 +194,7 @@ def get_my_loans():
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)
         
-        active_loans = Loan.query.filter_by(
+        active_loans = loan_query_with_loads().filter_by(
             user_id=user_id,
             status='active'
         ).order_by(Loan.due_date.asc()).all()
@@ -197,17 +211,25 @@ def get_loan_history():
     """
     Get current user's loan history
     
+    Query Parameters:
+        page: Page number (enables pagination)
+        per_page: Page size (default: ITEMS_PER_PAGE, max: 100)
+    
     Returns:
-        200: List of all loans
+        200: List of all loans, or a page {items, total, pages, page, per_page}
+             when page/per_page is given
     """
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)
         
-        loans = Loan.query.filter_by(user_id=user_id)\
-            .order_by(Loan.borrow_date.desc()).all()
+        query = loan_rows_query().filter(Loan.user_id == user_id)\
+            .order_by(Loan.borrow_date.desc(), Loan.id.desc())
         
-        return jsonify([loan.to_dict() for loan in loans]), 200
+        if is_page_request():
+            return jsonify(paginated(query, loan_row_to_dict)), 200
+        
+        return jsonify([loan_row_to_dict(loan) for loan in query.all()]), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -221,9 +243,12 @@ def get_all_loans():
     
     Query Parameters:
         status: Filter by status (active, returned, overdue)
+        page: Page number (enables pagination)
+        per_page: Page size (default: ITEMS_PER_PAGE, max: 100)
     
     Returns:
-        200: List of all loans
+        200: List of all loans, or a page {items, total, pages, page, per_page}
+             when page/per_page is given
         403: Admin access required
     """
     try:
@@ -232,13 +257,16 @@ def get_all_loans():
         
         status = request.args.get('status')
         
-        query = Loan.query
+        query = loan_rows_query()
         if status:
-            query = query.filter_by(status=status)
+            query = query.filter(Loan.status == status)
+        
+        query = query.order_by(Loan.borrow_date.desc(), Loan.id.desc())
         
-        loans = query.order_by(Loan.borrow_date.desc()).all()
+        if is_page_request():
+            return jsonify(paginated(query, loan_row_to_dict)), 200
         
-        return jsonify([loan.to_dict() for loan in loans]), 200
+        return jsonify([loan_row_to_dict(loan) for loan in query.all()]), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -250,8 +278,13 @@ def get_overdue_loans():
     """
     Get all overdue loans (Admin only)
     
+    Query Parameters:
+        page: Page number (enables pagination)
+        per_page: Page size (default: ITEMS_PER_PAGE, max: 100)
+    
     Returns:
-        200: List of overdue loans
+        200: List of overdue loans, or a page {items, total, pages, page, per_page}
+             when page/per_page is given
         403: Admin access required
     """
     try:
@@ -260,12 +293,99 @@ def get_overdue_loans():
         
         today = datetime.utcnow()
         
-        overdue_loans = Loan.query.filter(
+        query = loan_query_with_loads().filter(
             Loan.status.in_(['active', 'overdue']),
             Loan.due_date < today
-        ).order_by(Loan.due_date.asc()).all()
+        ).order_by(Loan.due_date.asc(), Loan.id.asc())
+        
+        if is_page_request():
+            return jsonify(paginated(query, Loan.to_dict)), 200
+        
+        return jsonify([loan.to_dict() for loan in query.all()]), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def export_row(row):
+    """Flatten a loan_rows_query() row to the EXPORT_FIELDS values"""
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'user_name': row.user_name,
+        'user_email': row.user_email,
+        'book_id': row.book_id,
+        'book_isbn': row.book_isbn,
+        'book_title': row.book_title,
+        'borrow_date': row.borrow_date.isoformat(),
+        'due_date': row.due_date.isoformat(),
+        'return_date': row.return_date.isoformat() if row.return_date else None,
+        'status': row.status,
+        'fine_amount': round(row.fine_amount, 2)
+    }
+
+
+@loans_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_loans():
+    """
+    Export all loans as CSV or JSON Lines (Admin only)
+    
+    Rows are streamed from a server-side cursor in batches, so memory use
+    stays flat however many loans there are.
+    
+    Query Parameters:
+        format: csv (default) or jsonl
+        status: Filter by status (active, returned, overdue)
+    
+    Returns:
+        200: Streamed export file
+        400: Unknown format
+        403: Admin access required
+    """
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ('csv', 'jsonl'):
+            return jsonify({'error': 'Invalid format. Choose csv or jsonl'}), 400
         
-        return jsonify([loan.to_dict() for loan in overdue_loans]), 200
+        status = request.args.get('status')
+        
+        query = loan_rows_query()
+        if status:
+            query = query.filter(Loan.status == status)
+        
+        query = query.order_by(Loan.id.asc())\
+            .execution_options(stream_results=True).yield_per(500)
+        
+        def generate_csv():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for row in query:
+                writer.writerow(export_row(row))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        
+        def generate_jsonl():
+            for row in query:
+                yield current_app.json.dumps(export_row(row)) + '\n'
+        
+        if export_format == 'csv':
+            body, mimetype = generate_csv(), 'text/csv'
+        else:
+            body, mimetype = generate_jsonl(), 'application/x-ndjson'
+        
+        return Response(
+            stream_with_context(body),
+            status=200,
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=loans.{export_format}'}
+        )
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
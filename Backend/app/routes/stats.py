@@ -2,22 +2,42 @@
 Statistics Routes
 Provides statistics and dashboard data for the frontend
 """
-from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import func
+from flask import Blueprint, current_app, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import Integer, and_, case, cast, func, select
 from datetime import datetime, timedelta
-from app import db
+from app import cache, db
 from app.models import User, Book, Loan, Category
+from app.utils import (
+    DASHBOARD_CACHE_KEY, STATS_CACHE_KEY, days_since, is_admin, loan_row_to_dict, loan_rows_query
+)
 
 stats_bp = Blueprint('stats', __name__)
 
 
-def is_admin():
-    """Check if current user is admin"""
-    user_id_str = get_jwt_identity()
-    user_id = int(user_id_str)
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
+def count_if(condition):
+    """Conditional COUNT that works on every dialect (no FILTER clause needed)"""
+    # CAST keeps the result an int where SUM returns DECIMAL (MySQL)
+    return cast(func.coalesce(func.sum(case((condition, 1), else_=0)), 0), Integer)
+
+
+def sum_if(column, condition):
+    """Conditional SUM of column over rows matching condition"""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0, type_=column.type)
+
+
+def get_book_totals():
+    """
+    Get active book count and copy totals in one query
+    
+    Returns:
+        Row: (total_books, total_copies, available_copies)
+    """
+    return db.session.query(
+        func.count(Book.id),
+        func.coalesce(func.sum(Book.total_copies), 0),
+        func.coalesce(func.sum(Book.available_copies), 0)
+    ).filter(Book.is_active == True).one()
 
 
 @stats_bp.route('/stats', methods=['GET'])
@@ -25,38 +45,32 @@ def get_stats():
     """
     Get general library statistics (public endpoint)
     
+    Cached for STATS_CACHE_TTL seconds and cleared on any write.
+    
     Returns:
         200: Library statistics
     """
     try:
-        # Total active books
-        total_books = Book.query.filter_by(is_active=True).count()
-        
-        # Total copies
-        total_copies = db.session.query(func.sum(Book.total_copies))\
-            .filter_by(is_active=True).scalar() or 0
-        
-        # Available copies
-        available_copies = db.session.query(func.sum(Book.available_copies))\
-            .filter_by(is_active=True).scalar() or 0
-        
-        # Total members
-        total_members = User.query.filter_by(role='member', is_active=True).count()
+        stats = cache.get(STATS_CACHE_KEY)
+        if stats is not None:
+            return jsonify(stats), 200
         
-        # Active loans
-        active_loans = Loan.query.filter_by(status='active').count()
-        
-        # Overdue loans
         today = datetime.utcnow()
-        overdue_loans = Loan.query.filter(
-            Loan.status == 'active',
-            Loan.due_date < today
-        ).count()
         
-        # Total categories
-        total_categories = Category.query.count()
+        # Active books and copies
+        total_books, total_copies, available_copies = get_book_totals()
         
-        return jsonify({
+        # Loan counts, with member and category totals as scalar subqueries
+        active_loans, overdue_loans, total_members, total_categories = db.session.query(
+            count_if(Loan.status == 'active'),
+            count_if(and_(Loan.status == 'active', Loan.due_date < today)),
+            select(func.count(User.id))
+                .where(User.role == 'member', User.is_active == True)
+                .scalar_subquery(),
+            select(func.count(Category.id)).scalar_subquery()
+        ).select_from(Loan).one()
+        
+        stats = {
             'totalBooks': total_books,
             'totalCopies': int(total_copies),
             'availableCopies': int(available_copies),
@@ -65,18 +79,35 @@ def get_stats():
             'activeLoans': active_loans,
             'overdueLoans': overdue_loans,
             'totalCategories': total_categories
-        }), 200
+        }
+        cache.set(STATS_CACHE_KEY, stats, timeout=current_app.config['STATS_CACHE_TTL'])
+        
+        return jsonify(stats), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def overdue_book_to_dict(row):
+    """Convert a loan_rows_query() row with days_overdue to an overdueBooks entry"""
+    loan = loan_row_to_dict(row)
+    return {
+        'id': loan['id'],
+        'book': loan['book'],
+        'user': loan['user'],
+        'dueDate': loan['due_date'],
+        'daysOverdue': row.days_overdue
+    }
+
+
 @stats_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard():
     """
     Get detailed dashboard data (Admin only)
     
+    Cached for DASHBOARD_CACHE_TTL seconds and cleared on any write.
+    
     Returns:
         200: Dashboard data with stats, charts, and recent activity
         403: Admin access required
@@ -85,38 +116,40 @@ def get_dashboard():
         if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
+        dashboard = cache.get(DASHBOARD_CACHE_KEY)
+        if dashboard is not None:
+            return jsonify(dashboard), 200
+        
         today = datetime.utcnow()
         week_ago = today - timedelta(days=7)
         
-        # === Quick Stats ===
-        total_books = Book.query.filter_by(is_active=True).count()
-        total_copies = db.session.query(func.sum(Book.total_copies))\
-            .filter_by(is_active=True).scalar() or 0
-        available_copies = db.session.query(func.sum(Book.available_copies))\
-            .filter_by(is_active=True).scalar() or 0
-        total_members = User.query.filter_by(role='member').count()
-        active_members = User.query.filter_by(role='member', is_active=True).count()
-        active_loans = Loan.query.filter_by(status='active').count()
-        
-        overdue_loans = Loan.query.filter(
-            Loan.status == 'active',
-            Loan.due_date < today
-        ).count()
+        # === Quick Stats (one aggregate query per table) ===
+        total_books, total_copies, available_copies = get_book_totals()
         
-        # Total fines pending
-        total_fines = db.session.query(func.sum(Loan.fine_amount))\
-            .filter(Loan.fine_amount > 0, Loan.return_date.is_(None)).scalar() or 0
+        total_members, active_members = db.session.query(
+            count_if(User.role == 'member'),
+            count_if(and_(User.role == 'member', User.is_active == True))
+        ).one()
+        
+        (active_loans, overdue_loans, total_fines,
+         loans_this_week, returns_this_week) = db.session.query(
+            count_if(Loan.status == 'active'),
+            count_if(and_(Loan.status == 'active', Loan.due_date < today)),
+            sum_if(Loan.fine_amount, and_(Loan.fine_amount > 0, Loan.return_date.is_(None))),
+            count_if(Loan.borrow_date >= week_ago),
+            count_if(and_(Loan.return_date >= week_ago, Loan.status == 'returned'))
+        ).one()
         
         # === Books by Category ===
+        # The active filter sits in the ON clause so empty categories still report 0
         books_by_category = db.session.query(
             Category.name,
             func.count(Book.id).label('count')
-        ).outerjoin(Book, Book.category_id == Category.id)\
-         .filter(Book.is_active == True)\
+        ).outerjoin(Book, and_(Book.category_id == Category.id, Book.is_active == True))\
          .group_by(Category.id, Category.name).all()
         
         # === Recent Loans (last 10) ===
-        recent_loans = Loan.query\
+        recent_loans = loan_rows_query()\
             .order_by(Loan.borrow_date.desc())\
             .limit(10).all()
         
@@ -126,29 +159,20 @@ def get_dashboard():
             Book.title,
             Book.author,
             func.count(Loan.id).label('borrow_count')
-        ).join(Loan).filter(Book.is_active == True)\
-         .group_by(Book.id)\
+        ).join(Loan, Loan.book_id == Book.id).filter(Book.is_active == True)\
+         .group_by(Book.id, Book.title, Book.author)\
          .order_by(func.count(Loan.id).desc())\
          .limit(5).all()
         
-        # === Loans this week ===
-        loans_this_week = Loan.query.filter(
-            Loan.borrow_date >= week_ago
-        ).count()
-        
-        # === Returns this week ===
-        returns_this_week = Loan.query.filter(
-            Loan.return_date >= week_ago,
-            Loan.status == 'returned'
-        ).count()
-        
         # === Overdue Books Details ===
-        overdue_books = Loan.query.filter(
+        overdue_books = loan_rows_query().add_columns(
+            days_since(Loan.due_date, today).label('days_overdue')
+        ).filter(
             Loan.status == 'active',
             Loan.due_date < today
         ).order_by(Loan.due_date.asc()).limit(10).all()
         
-        return jsonify({
+        dashboard = {
             'stats': {
                 'totalBooks': total_books,
                 'totalCopies': int(total_copies),
@@ -175,18 +199,12 @@ def get_dashboard():
                 }
                 for book in popular_books
             ],
-            'recentLoans': [loan.to_dict() for loan in recent_loans],
-            'overdueBooks': [
-                {
-                    'id': loan.id,
-                    'book': loan.book.to_dict(),
-                    'user': loan.user.to_dict(),
-                    'dueDate': loan.due_date.isoformat(),
-                    'daysOverdue': (today - loan.due_date).days
-                }
-                for loan in overdue_books
-            ]
-        }), 200
+            'recentLoans': [loan_row_to_dict(loan) for loan in recent_loans],
+            'overdueBooks': [overdue_book_to_dict(loan) for loan in overdue_books]
+        }
+        cache.set(DASHBOARD_CACHE_KEY, dashboard, timeout=current_app.config['DASHBOARD_CACHE_TTL'])
+        
+        return jsonify(dashboard), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -4,21 +4,17 @@ Handles user management, profiles, and fines
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import func
+from sqlalchemy import and_, func
 from app import db
 from app.models import User, Loan, Book, Category
+from app.utils import (
+    clear_stats_cache, is_admin, is_page_request, loan_query_with_loads, paginated, safe_query,
+    refresh_outstanding_fines, update_returning
+)
 
 users_bp = Blueprint('users', __name__)
 
 
-def is_admin():
-    """Check if current user is admin"""
-    user_id_str = get_jwt_identity()
-    user_id = int(user_id_str)
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
-
-
 @users_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
@@ -77,6 +73,7 @@ def update_profile():
             user.set_password(data['password'])
         
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -100,16 +97,19 @@ def get_fines():
     try:
         user_id = int(get_jwt_identity())
         
-        # Get all loans with fines that haven't been returned
-        loans_with_fines = Loan.query.filter(
+        # Total of fines on loans that haven't been returned
+        total_fines = db.session.query(func.coalesce(func.sum(Loan.fine_amount), 0))\
+            .filter(Loan.user_id == user_id, Loan.fine_amount > 0, Loan.return_date.is_(None))\
+            .scalar()
+        
+        # Get all loans with fines
+        loans_with_fines = loan_query_with_loads().filter(
             Loan.user_id == user_id,
             Loan.fine_amount > 0
         ).all()
         
-        total_fines = sum(loan.fine_amount for loan in loans_with_fines if not loan.return_date)
-        
         return jsonify({
-            'total_fines': round(total_fines, 2),
+            'total_fines': round(float(total_fines), 2),
             'loans': [loan.to_dict() for loan in loans_with_fines]
         }), 200
         
@@ -145,19 +145,30 @@ def pay_fine():
         loan_id = data['loan_id']
         amount = float(data['amount'])
         
-        loan = Loan.query.get_or_404(loan_id)
-        
-        # Verify loan belongs to user
-        if loan.user_id != user_id:
-            return jsonify({'error': 'Unauthorized to pay this fine'}), 403
-        
-        # Validate payment amount
-        if amount < loan.fine_amount:
+        # Pay fine in one UPDATE; the loan is only re-read to explain a failure
+        loan = update_returning(
+            Loan, loan_id,
+            Loan.user_id == user_id,
+            Loan.fine_amount <= amount,
+            fine_amount=0
+        )
+        
+        if loan is None:
+            owner_id = db.session.query(Loan.user_id).filter(Loan.id == loan_id).scalar()
+            if owner_id is None:
+                return jsonify({'error': 'Loan not found'}), 404
+            
+            # Verify loan belongs to user
+            if owner_id != user_id:
+                return jsonify({'error': 'Unauthorized to pay this fine'}), 403
+            
             return jsonify({'error': 'Insufficient payment amount'}), 400
         
-        # Pay fine
-        loan.fine_amount = 0
+        if loan.return_date is None:
+            refresh_outstanding_fines([user_id])
+        
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'Fine paid successfully',
@@ -177,15 +188,25 @@ def get_all_users():
     """
     Get all users (Admin only)
     
+    Query Parameters:
+        page: Page number (enables pagination)
+        per_page: Page size (default: ITEMS_PER_PAGE, max: 100)
+    
     Returns:
-        200: List of all users
+        200: List of all users, or a page {items, total, pages, page, per_page}
+             when page/per_page is given
         403: Admin access required
     """
     try:
         if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
-        users = User.query.all()
+        query = safe_query(User).order_by(User.id.asc())
+        
+        if is_page_request():
+            return jsonify(paginated(query, User.to_dict)), 200
+        
+        users = query.all()
         return jsonify([user.to_dict() for user in users]), 200
         
     except Exception as e:
@@ -260,6 +281,7 @@ def update_user(user_id):
             user.is_active = bool(data['is_active'])
         
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({
             'message': 'User updated successfully',
@@ -289,9 +311,12 @@ def toggle_user_status(user_id):
         if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
-        user = User.query.get_or_404(user_id)
-        user.is_active = not user.is_active
+        user = update_returning(User, user_id, is_active=~User.is_active)
+        if user is None:
+            return jsonify({'error': 'User not found'}), 404
+        
         db.session.commit()
+        clear_stats_cache()
         
         status = 'activated' if user.is_active else 'deactivated'
         
@@ -331,12 +356,14 @@ def delete_user(user_id):
             return jsonify({'error': 'Cannot delete admin users'}), 400
         
         # Check if user has active loans
-        active_loans = Loan.query.filter_by(user_id=user_id, status='active').count()
-        if active_loans > 0:
+        has_active_loans = db.session.query(Loan.id)\
+            .filter_by(user_id=user_id, status='active').first() is not None
+        if has_active_loans:
             return jsonify({'error': 'Cannot delete user with active loans'}), 400
         
         db.session.delete(user)
         db.session.commit()
+        clear_stats_cache()
         
         return jsonify({'message': 'User deleted successfully'}), 200
         
@@ -441,7 +468,7 @@ def get_inventory_report():
         books_by_category = db.session.query(
             Category.name,
             func.count(Book.id).label('count')
-        ).outerjoin(Book).filter(Book.is_active == True)\
+        ).outerjoin(Book, and_(Book.category_id == Category.id, Book.is_active == True))\
          .group_by(Category.id, Category.name).all()
         
         # Total members
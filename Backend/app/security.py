@@ -0,0 +1,171 @@
+"""
+Security Module
+Pluggable password hashers, optionally running bcrypt outside the request worker
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import flask_bcrypt
+from flask import current_app
+
+# Process pool for bcrypt work, created by init_security when enabled
+_hash_executor = None
+
+
+class PasswordHasher(ABC):
+    """Interface for password hashing backends"""
+    
+    # Hash prefix used to recognise hashes produced by this backend
+    prefix = ''
+    
+    @abstractmethod
+    def hash(self, password):
+        """Return a hash string for password"""
+    
+    @abstractmethod
+    def verify(self, pw_hash, password):
+        """Return True if password matches pw_hash"""
+    
+    def identifies(self, pw_hash):
+        """Check if pw_hash was produced by this backend"""
+        return pw_hash.startswith(self.prefix)
+
+
+class BcryptHasher(PasswordHasher):
+    """bcrypt hasher, using the process pool when one is configured"""
+    
+    prefix = '$2'
+    
+    def __init__(self, rounds=12):
+        self.rounds = rounds
+    
+    def hash(self, password):
+        if _hash_executor is None:
+            pw_hash = flask_bcrypt.generate_password_hash(password, self.rounds)
+        else:
+            pw_hash = _hash_executor.submit(
+                flask_bcrypt.generate_password_hash, password, self.rounds
+            ).result()
+        
+        return pw_hash.decode('utf-8')
+    
+    def verify(self, pw_hash, password):
+        if _hash_executor is None:
+            return flask_bcrypt.check_password_hash(pw_hash, password)
+        
+        return _hash_executor.submit(
+            flask_bcrypt.check_password_hash, pw_hash, password
+        ).result()
+
+
+class Argon2Hasher(PasswordHasher):
+    """Argon2id hasher (requires the argon2-cffi package)"""
+    
+    prefix = '$argon2'
+    
+    def __init__(self, time_cost=2, memory_cost=65536):
+        from argon2 import PasswordHasher as Argon2PasswordHasher
+        from argon2.exceptions import InvalidHashError, VerificationError
+        
+        self._hasher = Argon2PasswordHasher(time_cost=time_cost, memory_cost=memory_cost)
+        self._errors = (InvalidHashError, VerificationError)
+    
+    def hash(self, password):
+        return self._hasher.hash(password)
+    
+    def verify(self, pw_hash, password):
+        try:
+            return self._hasher.verify(pw_hash, password)
+        except self._errors:
+            return False
+
+
+class PlaintextHasher(PasswordHasher):
+    """No-op hasher for the test suite only - never use in production"""
+    
+    prefix = 'plain$'
+    
+    def hash(self, password):
+        return self.prefix + password
+    
+    def verify(self, pw_hash, password):
+        return pw_hash == self.prefix + password
+
+
+def create_hasher(app):
+    """
+    Build the password hasher selected by PASSWORD_HASHER
+    
+    Args:
+        app: Flask application instance
+    
+    Returns:
+        PasswordHasher instance
+    
+    Raises:
+        ValueError: Unknown hasher, or plaintext outside testing
+    """
+    name = app.config.get('PASSWORD_HASHER', 'bcrypt')
+    
+    if name == 'bcrypt':
+        return BcryptHasher(rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12))
+    if name == 'argon2':
+        return Argon2Hasher()
+    if name == 'plaintext':
+        if not app.config.get('TESTING'):
+            raise ValueError('PASSWORD_HASHER=plaintext is only allowed when TESTING is set')
+        return PlaintextHasher()
+    
+    raise ValueError(f'Unknown PASSWORD_HASHER: {name}')
+
+
+def init_security(app):
+    """
+    Set up the password hasher and hashing pool
+    
+    Args:
+        app: Flask application instance
+    """
+    global _hash_executor
+    
+    workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+    if workers and _hash_executor is None:
+        _hash_executor = ProcessPoolExecutor(max_workers=workers)
+    
+    app.extensions['hasher'] = create_hasher(app)
+
+
+def hash_password(password):
+    """
+    Hash a password with the configured hasher
+    
+    Args:
+        password: Plaintext password
+    
+    Returns:
+        str: Password hash
+    """
+    return current_app.extensions['hasher'].hash(password)
+
+
+def verify_password(pw_hash, password):
+    """
+    Check a password against a stored hash
+    
+    bcrypt hashes are still accepted after switching to another hasher,
+    so existing accounts keep working.
+    
+    Args:
+        pw_hash: Stored password hash
+        password: Plaintext password to check
+    
+    Returns:
+        bool: True if password matches, False otherwise
+    """
+    hasher = current_app.extensions['hasher']
+    if hasher.identifies(pw_hash):
+        return hasher.verify(pw_hash, password)
+    
+    if pw_hash.startswith(BcryptHasher.prefix):
+        return BcryptHasher().verify(pw_hash, password)
+    
+    return False
@@ -3,36 +3,483 @@ Utility Functions
 Helper functions for business logic
 """
 import re
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from app import db
-from app.models import Loan
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from flask_mail import Message
+from sqlalchemy import DateTime, Integer, cast, func, literal, literal_column, select, update
+from sqlalchemy.orm import raiseload, selectinload
+from app import cache, db, mail
+from app.models import Book, Category, Loan, User
 from app.config import Config
 
+# Notification emails, parsed once at import
+REMINDER_SUBJECT = 'Book Due Date Reminder - Library Management System'
+REMINDER_TEMPLATE = Template("""\
+Dear $name,
 
-def calculate_fines():
+This is a reminder that the following book is due soon:
+
+Book: $title
+Author: $author
+Due Date: $due_date
+
+Please return the book on time to avoid late fees.
+
+Thank you,
+Library Management System
+""")
+
+OVERDUE_SUBJECT = 'Overdue Book Notification - Library Management System'
+OVERDUE_TEMPLATE = Template("""\
+Dear $name,
+
+The following book is overdue:
+
+Book: $title
+Author: $author
+Due Date: $due_date
+Days Overdue: $days_overdue
+Fine Amount: $$$fine_amount
+
+Please return the book as soon as possible.
+
+Thank you,
+Library Management System
+""")
+
+# Thread pool for SMTP sends, created by init_mail_queue when enabled
+_mail_executor = None
+
+# Compiled once at import; validate_email runs on every registration. The
+# address is split at '@' first so each half is matched by a pattern with
+# no overlapping repeats, and over-long input is rejected before any regex
+EMAIL_MAX_LENGTH = 254
+EMAIL_LOCAL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]{1,64}')
+EMAIL_DOMAIN_PATTERN = re.compile(r'[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)*\.[a-zA-Z]{2,}')
+
+
+def is_admin():
+    """
+    Check if current user is admin
+    
+    Reads the role claim embedded at login; tokens issued without it fall
+    back to a single-column role lookup, cached per JWT identity for the
+    rest of the request.
+    """
+    claims = get_jwt()
+    if 'role' in claims:
+        return claims['role'] == 'admin'
+    
+    identity = get_jwt_identity()
+    cached = g.get('admin_check')
+    if cached is None or cached[0] != identity:
+        role = db.session.query(User.role).filter(User.id == int(identity)).scalar()
+        cached = g.admin_check = (identity, role == 'admin')
+    return cached[1]
+
+
+def safe_query(model):
+    """
+    Start a query that refuses unplanned relationship lazy loads
+    
+    When RAISE_ON_LAZY_LOAD is set (testing), touching a relationship that
+    was not eager-loaded raises instead of silently issuing another SELECT.
+    
+    Args:
+        model: Model class to query
+    
+    Returns:
+        Query for model
+    """
+    query = model.query
+    if current_app.config.get('RAISE_ON_LAZY_LOAD'):
+        query = query.options(raiseload('*', sql_only=True))
+    return query
+
+
+def loan_query_with_loads():
+    """
+    Start a loan query that eager-loads everything Loan.to_dict() touches
+    
+    Users and books are fetched with one extra SELECT each for the whole
+    result (and each book's category is joined in), instead of one per loan.
+    Built on safe_query, so any other relationship access raises in testing.
+    
+    Returns:
+        Query for Loan
+    """
+    return safe_query(Loan).options(
+        selectinload(Loan.user),
+        selectinload(Loan.book).joinedload(Book.category)
+    )
+
+
+# Columns read by loan_row_to_dict; labelled so they don't clash across tables
+LOAN_LIST_COLUMNS = (
+    Loan.id,
+    Loan.borrow_date,
+    Loan.due_date,
+    Loan.return_date,
+    Loan.status,
+    Loan.fine_amount,
+    User.id.label('user_id'),
+    User.name.label('user_name'),
+    User.email.label('user_email'),
+    User.phone.label('user_phone'),
+    User.role.label('user_role'),
+    User.is_active.label('user_is_active'),
+    User.created_at.label('user_created_at'),
+    Book.id.label('book_id'),
+    Book.isbn.label('book_isbn'),
+    Book.title.label('book_title'),
+    Book.author.label('book_author'),
+    Category.id.label('category_id'),
+    Category.name.label('category_name'),
+    Book.total_copies.label('book_total_copies'),
+    Book.available_copies.label('book_available_copies'),
+    Book.publication_year.label('book_publication_year'),
+    Book.is_active.label('book_is_active'),
+    Book.created_at.label('book_created_at')
+)
+
+
+def loan_rows_query():
+    """
+    Start a read-only loan listing query returning plain rows
+    
+    Loans, users, books and categories come back from one joined SELECT as
+    tuples, skipping ORM instances for listings that are only serialized.
+    
+    Returns:
+        Query yielding LOAN_LIST_COLUMNS rows
+    """
+    return db.session.query(*LOAN_LIST_COLUMNS)\
+        .join(User, Loan.user_id == User.id)\
+        .join(Book, Loan.book_id == Book.id)\
+        .outerjoin(Category, Book.category_id == Category.id)
+
+
+def loan_row_to_dict(row):
+    """Convert a LOAN_LIST_COLUMNS row to the same shape as Loan.to_dict()"""
+    return {
+        'id': row.id,
+        'user': {
+            'id': row.user_id,
+            'name': row.user_name,
+            'email': row.user_email,
+            'phone': row.user_phone,
+            'role': row.user_role,
+            'is_active': row.user_is_active,
+            'created_at': row.user_created_at.isoformat()
+        },
+        'book': {
+            'id': row.book_id,
+            'isbn': row.book_isbn,
+            'title': row.book_title,
+            'author': row.book_author,
+            'category': {
+                'id': row.category_id,
+                'name': row.category_name
+            } if row.category_id is not None else None,
+            'total_copies': row.book_total_copies,
+            'available_copies': row.book_available_copies,
+            'publication_year': row.book_publication_year,
+            'is_active': row.book_is_active,
+            'created_at': row.book_created_at.isoformat()
+        },
+        'borrow_date': row.borrow_date.isoformat(),
+        'due_date': row.due_date.isoformat(),
+        'return_date': row.return_date.isoformat() if row.return_date else None,
+        'status': row.status,
+        'fine_amount': round(row.fine_amount, 2)
+    }
+
+
+def days_since(column, now):
+    """
+    SQL expression for the whole days elapsed from a datetime column to now
+    
+    Matches Python's (now - value).days for past values on SQLite,
+    PostgreSQL and MySQL.
+    
+    Args:
+        column: DateTime column or expression
+        now: Reference datetime, sent as a bound parameter
+    
+    Returns:
+        Integer SQL expression
+    """
+    now = literal(now, DateTime)
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect == 'sqlite':
+        # CAST truncates, which is floor for the past values this is used on,
+        # and avoids floor() that older SQLite builds lack
+        return cast(func.julianday(now) - func.julianday(column), Integer)
+    if dialect in ('mysql', 'mariadb'):
+        return func.floor(func.timestampdiff(literal_column('SECOND'), column, now) / 86400)
+    return cast(func.floor(func.extract('epoch', now - column) / 86400), Integer)
+
+
+def update_returning(model, pk, *criteria, **values):
+    """
+    Apply a conditional UPDATE to one row and return the updated instance
+    
+    Uses UPDATE ... RETURNING where the database supports it, otherwise
+    re-reads the row after a matching UPDATE.
+    
+    Args:
+        model: Model class to update
+        pk: Primary key of the row
+        *criteria: Extra conditions the row must satisfy
+        **values: Column values to set
+    
+    Returns:
+        Updated instance, or None if no row matched
+    """
+    stmt = update(model).where(model.id == pk, *criteria).values(**values)
+    
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(stmt.returning(model)).scalars().first()
+    
+    if db.session.execute(stmt).rowcount == 0:
+        return None
+    return db.session.get(model, pk, populate_existing=True)
+
+
+# Upper bound for client-requested page sizes
+MAX_PAGE_SIZE = 100
+
+
+def is_page_request():
+    """Check if the client asked for a numbered page"""
+    return 'page' in request.args or 'per_page' in request.args
+
+
+def paginated(query, serialize):
+    """
+    Run a query one numbered page at a time
+    
+    Args:
+        query: Ordered query to paginate
+        serialize: Function converting one result row to a dict
+    
+    Returns:
+        dict: {items, total, pages, page, per_page}
+    """
+    per_page = request.args.get('per_page', type=int) or current_app.config['ITEMS_PER_PAGE']
+    page = query.paginate(
+        page=request.args.get('page', 1, type=int),
+        per_page=max(1, min(per_page, MAX_PAGE_SIZE)),
+        error_out=False
+    )
+    return {
+        'items': [serialize(item) for item in page.items],
+        'total': page.total,
+        'pages': page.pages,
+        'page': page.page,
+        'per_page': page.per_page
+    }
+
+
+# Cache keys for the aggregate statistics endpoints
+STATS_CACHE_KEY = 'stats'
+DASHBOARD_CACHE_KEY = 'dashboard'
+
+
+def clear_stats_cache():
+    """Drop cached statistics after books, loans or users change"""
+    cache.delete_many(STATS_CACHE_KEY, DASHBOARD_CACHE_KEY)
+
+
+def refresh_outstanding_fines(user_ids=None):
+    """
+    Recompute User.outstanding_fines from the users' unreturned loans
+    
+    Call after changing a fine or returning a fined loan, before commit.
+    The totals are summed in the UPDATE itself, so they can't drift.
+    
+    Args:
+        user_ids: IDs (or a SELECT of IDs) of users to refresh (default: all users)
+    """
+    total = select(func.coalesce(func.sum(Loan.fine_amount), 0))\
+        .where(Loan.user_id == User.id, Loan.fine_amount > 0, Loan.return_date.is_(None))\
+        .scalar_subquery()
+    
+    stmt = update(User).values(outstanding_fines=total)
+    if user_ids is not None:
+        stmt = stmt.where(User.id.in_(user_ids))
+    
+    db.session.execute(stmt, execution_options={'synchronize_session': False})
+
+
+def calculate_fines(batch_size=1000):
     """
     Calculate fines for all overdue loans
     Run this as a scheduled task (cron job)
+    
+    Loans are fined in id-ordered batches, each its own UPDATE and commit,
+    so a large backlog never holds one long transaction or a huge id list.
+    
+    Args:
+        batch_size: Loans updated per statement
+    
+    Returns:
+        int: Number of loans fined
     """
     today = datetime.utcnow()
-    grace_end_date = today - timedelta(days=Config.GRACE_PERIOD_DAYS)
     
-    # Get all active loans that are past grace period
-    overdue_loans = Loan.query.filter(
-        Loan.status == 'active',
-        Loan.due_date < grace_end_date
-    ).all()
+    # Active loans at least one whole day past the grace period
+    fine_cutoff = today - timedelta(days=Config.GRACE_PERIOD_DAYS + 1)
+    is_finable = (Loan.status == 'active', Loan.due_date <= fine_cutoff)
+    
+    # Fine expression and config values are resolved once, not per batch
+    fine_amount = (days_since(Loan.due_date, today) - Config.GRACE_PERIOD_DAYS) * Config.FINE_PER_DAY
     
-    for loan in overdue_loans:
-        # Calculate days overdue (excluding grace period)
-        days_overdue = (today - loan.due_date).days - Config.GRACE_PERIOD_DAYS
+    fined = 0
+    last_id = 0
+    while True:
+        # Upper id of the next batch (keyset pagination on Loan.id)
+        batch_ids = db.session.query(Loan.id)\
+            .filter(Loan.id > last_id, *is_finable)\
+            .order_by(Loan.id.asc()).limit(batch_size).all()
+        if not batch_ids:
+            break
+        in_batch = (Loan.id > last_id, Loan.id <= batch_ids[-1].id)
         
-        if days_overdue > 0:
-            loan.fine_amount = days_overdue * Config.FINE_PER_DAY
-            loan.status = 'overdue'
+        # Fine the batch's loans in one set-based UPDATE
+        result = db.session.execute(
+            update(Loan)
+            .where(*in_batch, *is_finable)
+            .values(fine_amount=fine_amount, status='overdue'),
+            execution_options={'synchronize_session': False}
+        )
+        refresh_outstanding_fines(select(Loan.user_id).where(*in_batch))
+        db.session.commit()
+        
+        fined += result.rowcount
+        last_id = batch_ids[-1].id
+    
+    if fined:
+        clear_stats_cache()
+    return fined
+
+
+def init_mail_queue(app):
+    """
+    Start the background mail pool
+    
+    Args:
+        app: Flask application instance
+    """
+    global _mail_executor
+    
+    workers = app.config.get('MAIL_SEND_WORKERS', 0)
+    if workers and _mail_executor is None:
+        _mail_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail')
+
+
+def _send_batch(messages):
+    """Send messages over one SMTP connection, returning how many went out"""
+    sent = 0
+    with mail.connect() as conn:
+        for msg in messages:
+            try:
+                conn.send(msg)
+                sent += 1
+            except Exception as e:
+                current_app.logger.warning(f'Error sending email to {msg.recipients}: {str(e)}')
+    return sent
+
+
+def _run_in_app_context(app, send, payload):
+    """Run a mail send from a pool thread, logging failures"""
+    with app.app_context():
+        try:
+            send(payload)
+        except Exception as e:
+            app.logger.warning(f'Error sending email: {str(e)}')
+
+
+def dispatch_message(msg):
+    """
+    Send a mail message, in the background when the mail pool is enabled
+    
+    The SMTP exchange runs on a pool thread so the caller returns at once;
+    without the pool the message is sent inline and errors propagate.
+    
+    Args:
+        msg: flask_mail Message to send
+    """
+    if _mail_executor is None:
+        mail.send(msg)
+        return
+    
+    _mail_executor.submit(_run_in_app_context, current_app._get_current_object(), mail.send, msg)
+
+
+def get_overdue_loans_for_notification(now=None):
+    """
+    Get overdue loans ready to pass to send_overdue_notification
+    
+    The user and book each notification reads are loaded up front in two
+    batched SELECTs, rather than two lazy loads per loan.
+    
+    Args:
+        now: Reference time (default: utcnow)
+    
+    Returns:
+        list: Overdue Loan objects, oldest due date first
+    """
+    return loan_query_with_loads().filter(
+        Loan.status.in_(['active', 'overdue']),
+        Loan.due_date < (now or datetime.utcnow()),
+        Loan.return_date.is_(None)
+    ).order_by(Loan.due_date.asc()).all()
+
+
+def build_reminder_message(loan):
+    """
+    Build the due date reminder email for a loan
+    
+    Args:
+        loan: Loan object with user and book loaded
     
-    db.session.commit()
-    return len(overdue_loans)
+    Returns:
+        Message: Email ready to send
+    """
+    body = REMINDER_TEMPLATE.substitute(
+        name=loan.user.name,
+        title=loan.book.title,
+        author=loan.book.author,
+        due_date=loan.due_date.date().isoformat()
+    )
+    return Message(subject=REMINDER_SUBJECT, recipients=[loan.user.email], body=body)
+
+
+def build_overdue_message(loan, now):
+    """
+    Build the overdue notification email for a loan
+    
+    Args:
+        loan: Loan object with user and book loaded
+        now: Reference time for days overdue
+    
+    Returns:
+        Message: Email ready to send
+    """
+    body = OVERDUE_TEMPLATE.substitute(
+        name=loan.user.name,
+        title=loan.book.title,
+        author=loan.book.author,
+        due_date=loan.due_date.date().isoformat(),
+        days_overdue=(now - loan.due_date).days,
+        fine_amount=f'{loan.fine_amount:.2f}'
+    )
+    return Message(subject=OVERDUE_SUBJECT, recipients=[loan.user.email], body=body)
 
 
 def send_due_date_reminder(loan):
@@ -42,71 +489,73 @@ def send_due_date_reminder(loan):
     Args:
         loan: Loan object to send reminder for
     """
-    from flask_mail import Message
-    from app import mail
-    
     try:
-        subject = "Book Due Date Reminder - Library Management System"
-        body = f"""
-        Dear {loan.user.name},
-        
-        This is a reminder that the following book is due soon:
-        
-        Book: {loan.book.title}
-        Author: {loan.book.author}
-        Due Date: {loan.due_date.strftime('%Y-%m-%d')}
-        
-        Please return the book on time to avoid late fees.
-        
-        Thank you,
-        Library Management System
-        """
-        
-        msg = Message(subject=subject, recipients=[loan.user.email], body=body)
-        mail.send(msg)
+        dispatch_message(build_reminder_message(loan))
         return True
     except Exception as e:
         print(f"Error sending email: {str(e)}")
         return False
 
 
-def send_overdue_notification(loan):
+def send_overdue_notification(loan, now=None):
     """
     Send email notification for overdue book
     
     Args:
         loan: Loan object to send notification for
+        now: Reference time for days overdue (default: utcnow); batch
+             callers pass one shared timestamp
     """
-    from flask_mail import Message
-    from app import mail
-    
     try:
-        subject = "Overdue Book Notification - Library Management System"
-        body = f"""
-        Dear {loan.user.name},
-        
-        The following book is overdue:
-        
-        Book: {loan.book.title}
-        Author: {loan.book.author}
-        Due Date: {loan.due_date.strftime('%Y-%m-%d')}
-        Days Overdue: {(datetime.utcnow() - loan.due_date).days}
-        Fine Amount: ${loan.fine_amount:.2f}
-        
-        Please return the book as soon as possible.
-        
-        Thank you,
-        Library Management System
-        """
-        
-        msg = Message(subject=subject, recipients=[loan.user.email], body=body)
-        mail.send(msg)
+        dispatch_message(build_overdue_message(loan, now or datetime.utcnow()))
         return True
     except Exception as e:
         print(f"Error sending email: {str(e)}")
         return False
 
 
+def send_bulk_notifications(loans, now=None):
+    """
+    Send overdue notifications for many loans over one SMTP connection
+    
+    Messages are built up front (they read the loans' ORM attributes); the
+    batch then goes out on the mail pool, or inline when it is disabled.
+    
+    Args:
+        loans: Loan objects with user and book loaded
+        now: Reference time for days overdue (default: utcnow)
+    
+    Returns:
+        int: Number of notifications queued, or sent when inline
+    """
+    now = now or datetime.utcnow()
+    messages = [build_overdue_message(loan, now) for loan in loans]
+    if not messages:
+        return 0
+    
+    if _mail_executor is None:
+        try:
+            return _send_batch(messages)
+        except Exception as e:
+            current_app.logger.warning(f'Error sending email: {str(e)}')
+            return 0
+    
+    _mail_executor.submit(_run_in_app_context, current_app._get_current_object(), _send_batch, messages)
+    return len(messages)
+
+
+def notify_overdue_loans():
+    """
+    Email every borrower with an overdue loan
+    Run this after calculate_fines in the scheduled task
+    
+    Returns:
+        int: Number of notifications queued or sent
+    """
+    now = datetime.utcnow()
+    return send_bulk_notifications(get_overdue_loans_for_notification(now), now)
+
+
 def validate_isbn(isbn):
     """
     Validate ISBN format (13 digits)
@@ -123,11 +572,9 @@ def validate_isbn(isbn):
     # Remove any hyphens or spaces
     isbn = isbn.replace('-', '').replace(' ', '')
     
-    # Check if 13 digits
-    if len(isbn) != 13 or not isbn.isdigit():
-        return False
-    
-    return True
+    # Check if 13 ASCII digits; isascii() is a flag check on the string, so
+    # the only scan is isdigit(), and Unicode digits like '٣' are rejected
+    return len(isbn) == 13 and isbn.isascii() and isbn.isdigit()
 
 
 def validate_email(email):
@@ -140,9 +587,11 @@ def validate_email(email):
     Returns:
         bool: True if valid, False otherwise
     """
-    if not email:
+    if not email or len(email) > EMAIL_MAX_LENGTH or email.count('@') != 1:
         return False
     
-    # Email regex pattern
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
\ No newline at end of file
+    local, domain = email.split('@')
+    return (
+        EMAIL_LOCAL_PATTERN.fullmatch(local) is not None
+        and EMAIL_DOMAIN_PATTERN.fullmatch(domain) is not None
+    )
\ No newline at end of file
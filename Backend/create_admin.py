@@ -8,115 +8,156 @@ from datetime import datetime
 
 app = create_app()
 
+# bcrypt (cost 12) hash of the default admin password 'admin123', computed
+# once so setup runs skip the KDF; verify_password accepts bcrypt hashes
+# whichever PASSWORD_HASHER is configured
+DEFAULT_ADMIN_PASSWORD_HASH = '$2b$12$F21ZbMBL9A4GlvBVrMMfF.sAz7ITR1FCO3dhw0dBo4IUtPsMpjgYu'
+
 
 def create_tables():
     """Create all database tables"""
-    with app.app_context():
-        db.create_all()
-        print("✓ Database tables created")
+    db.create_all()
+    print("✓ Database tables created")
+
+
+def insert_ignoring_conflicts(model, values):
+    """
+    INSERT a row unless it would violate a unique constraint
+    
+    Args:
+        model: Model class to insert into
+        values: Column values for the new row
+    
+    Returns:
+        bool: True if the row was inserted
+    """
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(model).values(**values).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(model).values(**values).on_conflict_do_nothing()
+    else:
+        from sqlalchemy import insert
+        stmt = insert(model).values(**values).prefix_with('IGNORE')
+    
+    return db.session.execute(stmt).rowcount > 0
 
 
 def create_admin_user():
     """Create default admin user"""
-    with app.app_context():
-        # Check if admin exists
-        admin = User.query.filter_by(email='admin@library.com').first()
-        
-        if not admin:
-            admin = User(
-                name='Admin User',
-                email='admin@library.com',
-                phone='1234567890',
-                role='admin'
-            )
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-            print("✓ Admin user created")
-            print("  Email: admin@library.com")
-            print("  Password: admin123")
-        else:
-            print("✓ Admin user already exists")
+    # Single INSERT that skips an existing admin instead of SELECT-then-INSERT,
+    # so concurrent runs can't race each other
+    created = insert_ignoring_conflicts(User, {
+        'name': 'Admin User',
+        'email': 'admin@library.com',
+        'phone': '1234567890',
+        'role': 'admin',
+        'password_hash': DEFAULT_ADMIN_PASSWORD_HASH
+    })
+    db.session.commit()
+    
+    if created:
+        print("✓ Admin user created")
+        print("  Email: admin@library.com")
+        print("  Password: admin123")
+    else:
+        print("✓ Admin user already exists")
 
 
 def create_categories():
     """Create default categories"""
-    with app.app_context():
-        categories = [
-            'Fiction', 'Non-Fiction', 'Science', 'History',
-            'Technology', 'Arts', 'Biography', 'Fantasy',
-            'Mystery', 'Romance'
-        ]
-        
-        created_count = 0
-        for cat_name in categories:
-            if not Category.query.filter_by(name=cat_name).first():
-                category = Category(name=cat_name)
-                db.session.add(category)
-                created_count += 1
-        
-        db.session.commit()
-        print(f"✓ {created_count} categories created")
+    categories = [
+        'Fiction', 'Non-Fiction', 'Science', 'History',
+        'Technology', 'Arts', 'Biography', 'Fantasy',
+        'Mystery', 'Romance'
+    ]
+    
+    # One IN query finds the categories that already exist, matched on the
+    # case-insensitive unique column so 'fiction' counts as 'Fiction'
+    existing = {
+        name_ci for (name_ci,) in db.session.query(Category.name_ci)
+        .filter(Category.name_ci.in_([name.lower() for name in categories]))
+    }
+    # Multi-row INSERT; bulk inserts skip @validates, so set name_ci here
+    new_categories = [
+        {'name': name, 'name_ci': name.lower()}
+        for name in categories if name.lower() not in existing
+    ]
+    created_count = len(new_categories)
+    
+    db.session.bulk_insert_mappings(Category, new_categories)
+    db.session.commit()
+    print(f"✓ {created_count} categories created")
 
 
 def create_sample_books():
     """Create sample books"""
-    with app.app_context():
-        # Get categories
-        fiction = Category.query.filter_by(name='Fiction').first()
-        science = Category.query.filter_by(name='Science').first()
-        tech = Category.query.filter_by(name='Technology').first()
-        
-        sample_books = [
-            {
-                'isbn': '9780141439518',
-                'title': 'Pride and Prejudice',
-                'author': 'Jane Austen',
-                'category_id': fiction.id if fiction else None,
-                'total_copies': 3,
-                'publication_year': 1813,
-                'description': 'A romantic novel of manners.'
-            },
-            {
-                'isbn': '9780393319928',
-                'title': 'A Brief History of Time',
-                'author': 'Stephen Hawking',
-                'category_id': science.id if science else None,
-                'total_copies': 2,
-                'publication_year': 1988,
-                'description': 'From the Big Bang to black holes.'
-            },
-            {
-                'isbn': '9780135957059',
-                'title': 'The Pragmatic Programmer',
-                'author': 'David Thomas',
-                'category_id': tech.id if tech else None,
-                'total_copies': 2,
-                'publication_year': 1999,
-                'description': 'Your journey to mastery.'
-            }
-        ]
-        
-        created_count = 0
-        for book_data in sample_books:
-            if not Book.query.filter_by(isbn=book_data['isbn']).first():
-                book = Book(**book_data)
-                book.available_copies = book.total_copies
-                db.session.add(book)
-                created_count += 1
-        
-        db.session.commit()
-        print(f"✓ {created_count} sample books created")
+    # Get categories
+    category_ids = dict(
+        db.session.query(Category.name, Category.id)
+        .filter(Category.name.in_(['Fiction', 'Science', 'Technology']))
+    )
+    
+    sample_books = [
+        {
+            'isbn': '9780141439518',
+            'title': 'Pride and Prejudice',
+            'author': 'Jane Austen',
+            'category_id': category_ids.get('Fiction'),
+            'total_copies': 3,
+            'publication_year': 1813,
+            'description': 'A romantic novel of manners.'
+        },
+        {
+            'isbn': '9780393319928',
+            'title': 'A Brief History of Time',
+            'author': 'Stephen Hawking',
+            'category_id': category_ids.get('Science'),
+            'total_copies': 2,
+            'publication_year': 1988,
+            'description': 'From the Big Bang to black holes.'
+        },
+        {
+            'isbn': '9780135957059',
+            'title': 'The Pragmatic Programmer',
+            'author': 'David Thomas',
+            'category_id': category_ids.get('Technology'),
+            'total_copies': 2,
+            'publication_year': 1999,
+            'description': 'Your journey to mastery.'
+        }
+    ]
+    
+    # One IN query finds the books that already exist
+    existing_isbns = {
+        isbn for (isbn,) in db.session.query(Book.isbn)
+        .filter(Book.isbn.in_([book['isbn'] for book in sample_books]))
+    }
+    
+    new_books = [
+        dict(book_data, available_copies=book_data['total_copies'])
+        for book_data in sample_books if book_data['isbn'] not in existing_isbns
+    ]
+    created_count = len(new_books)
+    
+    db.session.bulk_insert_mappings(Book, new_books)
+    db.session.commit()
+    print(f"✓ {created_count} sample books created")
 
 
 def main():
     """Run all setup functions"""
     print("\n=== Library Management System - Database Setup ===\n")
     
-    create_tables()
-    create_admin_user()
-    create_categories()
-    create_sample_books()
+    # One app context (and session) for the whole setup run
+    with app.app_context():
+        create_tables()
+        create_admin_user()
+        create_categories()
+        create_sample_books()
     
     print("\n=== Setup Complete! ===")
     print("\nYou can now:")
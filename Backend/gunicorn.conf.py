@@ -0,0 +1,30 @@
+"""
+Gunicorn Configuration
+Multi-worker gevent server settings for the database-bound API
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# One process per core; each gevent worker serves many requests while they
+# wait on the database instead of blocking the whole process
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    """Make psycopg2 yield to other greenlets while waiting on PostgreSQL"""
+    if worker_class != 'gevent':
+        return
+    
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        return
+    
+    patch_psycopg()
@@ -31,6 +31,15 @@ def init_db():
     print("Database initialized successfully!")
 
 
+@app.cli.command()
+def sync_fines():
+    """Recompute every user's outstanding fines total"""
+    from app.utils import refresh_outstanding_fines
+    refresh_outstanding_fines()
+    db.session.commit()
+    print("Outstanding fines recomputed!")
+
+
 @app.cli.command()
 def drop_db():
     """Drop all database tables"""
@@ -39,10 +48,5 @@ def drop_db():
 
 
 if __name__ == '__main__':
-    # Create tables if they don't exist
-    with app.app_context():
-        db.create_all()
-        print("Database tables created!")
-    
-    # Run development server
+    # Run development server (create tables first with `flask --app run init-db`)
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+Test Fixtures
+Shared application, database and client fixtures for the test suite
+"""
+import pytest
+from app import create_app, db
+from app.config import TestingConfig
+from app.models import User
+
+
+class InMemoryTestingConfig(TestingConfig):
+    """TestingConfig on a throwaway in-memory SQLite database"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+@pytest.fixture
+def app():
+    """Application with freshly created tables"""
+    app = create_app(InMemoryTestingConfig)
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Test client for the application"""
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_user(app):
+    """Admin account with password 'admin123'"""
+    user = User(name='Admin User', email='admin@library.com', role='admin')
+    user.set_password('admin123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def admin_headers(client, admin_user):
+    """Authorization header for the admin account"""
+    response = client.post('/api/auth/login', json={
+        'email': 'admin@library.com',
+        'password': 'admin123'
+    })
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
@@ -0,0 +1,54 @@
+"""
+Loans Route Tests
+Checks loan listings serialize their related users and books
+"""
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import Book, Category, Loan, User
+
+
+@pytest.fixture
+def loan(app):
+    """Active loan of a categorised book by a member"""
+    member = User(name='Member', email='member@library.com')
+    member.set_password('member123')
+    category = Category(name='Fiction')
+    book = Book(
+        isbn='9780141439518',
+        title='Pride and Prejudice',
+        author='Jane Austen',
+        category=category,
+        total_copies=2,
+        available_copies=1
+    )
+    loan = Loan(user=member, book=book, due_date=datetime.utcnow() + timedelta(days=14))
+    db.session.add(loan)
+    db.session.commit()
+    return loan
+
+
+def test_all_loans_include_user_and_book(client, admin_headers, loan):
+    """GET /loans/all serializes users and books without raising on lazy loads"""
+    response = client.get('/api/loans/all', headers=admin_headers)
+    
+    assert response.status_code == 200
+    loans = response.get_json()
+    assert len(loans) == 1
+    assert loans[0]['user']['email'] == 'member@library.com'
+    assert loans[0]['book']['title'] == 'Pride and Prejudice'
+    assert loans[0]['book']['category']['name'] == 'Fiction'
+
+
+def test_overdue_loans_include_user_and_book(client, admin_headers, loan):
+    """GET /loans/overdue serializes eager-loaded users and books"""
+    loan.due_date = datetime.utcnow() - timedelta(days=3)
+    db.session.commit()
+    
+    response = client.get('/api/loans/overdue', headers=admin_headers)
+    
+    assert response.status_code == 200
+    loans = response.get_json()
+    assert len(loans) == 1
+    assert loans[0]['user']['email'] == 'member@library.com'
+    assert loans[0]['book']['title'] == 'Pride and Prejudice'
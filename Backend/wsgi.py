@@ -0,0 +1,10 @@
+"""
+WSGI Entry Point
+Application object for production servers: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+from app import create_app
+from app.config import config
+
+# FLASK_CONFIG picks a configuration from app.config.config
+app = create_app(config[os.getenv('FLASK_CONFIG', 'production')])